@@ -0,0 +1,191 @@
+# admission.py
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the queue wait histogram buckets
+WAIT_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class AdmissionRejected(Exception):
+    """Raised when a request is not admitted to the LLM.
+
+    degradable is True when the request is fine but the LLM is too backed up
+    to answer within the latency SLO; callers can fall back to a DB-only
+    answer instead of returning status_code.
+    """
+
+    def __init__(self, status_code: int, retry_after: int, reason: str, degradable: bool = False):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+        self.degradable = degradable
+
+class AdmissionController:
+    """Bounded in-flight limit with per-user fair queuing in front of the LLM.
+
+    At most max_in_flight requests hold a slot. Requests beyond that wait in
+    a FIFO queue per user_id, and freed slots go to users round-robin so one
+    user's burst cannot starve everyone else. Requests are rejected up front
+    when the user's queue is full (429), the total queue is full (503), or
+    the estimated wait plus an LLM call would exceed latency_slo (503,
+    degradable).
+
+    Meant to be used from a single event loop.
+    """
+
+    def __init__(self, max_in_flight: int = 4, max_queue_per_user: int = 2, max_queue_total: int = 32,
+                 latency_slo: float = 15.0, initial_latency: float = 2.0):
+        for name, value in (("max_in_flight", max_in_flight), ("max_queue_per_user", max_queue_per_user),
+                            ("max_queue_total", max_queue_total)):
+            if value < 1:
+                raise ValueError(f"{name} must be at least 1, got {value}")
+        if latency_slo <= 0:
+            raise ValueError(f"latency_slo must be positive, got {latency_slo}")
+
+        self.max_in_flight = max_in_flight
+        self.max_queue_per_user = max_queue_per_user
+        self.max_queue_total = max_queue_total
+        self.latency_slo = latency_slo
+        # Exponentially weighted moving average of slot hold time
+        self.avg_latency = initial_latency
+
+        self.in_flight = 0
+        self.queued = 0
+        # user_id -> waiters; the first user in the dict is served next
+        self.queues: "OrderedDict[str, deque]" = OrderedDict()
+
+        self.admitted_total = 0
+        self.rejected_total = {"user_queue_full": 0, "queue_full": 0, "slo": 0, "timeout": 0}
+        self.wait_bucket_counts = [0] * len(WAIT_BUCKETS)
+        self.wait_count = 0
+        self.wait_sum = 0.0
+
+    def estimated_wait(self) -> float:
+        """Seconds a request arriving now would wait for a slot"""
+        if self.in_flight < self.max_in_flight and not self.queued:
+            return 0.0
+        rounds = self.queued // self.max_in_flight + 1
+        return rounds * self.avg_latency
+
+    def _reject(self, status_code: int, reason: str, wait: float, degradable: bool = False):
+        self.rejected_total[reason] += 1
+        retry_after = max(1, math.ceil(wait))
+        logger.warning(f"LLM admission rejected ({reason}), retry after {retry_after}s")
+        raise AdmissionRejected(status_code, retry_after, reason, degradable)
+
+    def _observe_wait(self, wait: float):
+        self.admitted_total += 1
+        self.wait_count += 1
+        self.wait_sum += wait
+        for i, bound in enumerate(WAIT_BUCKETS):
+            if wait <= bound:
+                self.wait_bucket_counts[i] += 1
+
+    async def acquire(self, user_id: str) -> float:
+        """Wait for an LLM slot; returns the time spent queued in seconds"""
+        estimate = self.estimated_wait()
+        if estimate == 0.0:
+            self.in_flight += 1
+            self._observe_wait(0.0)
+            return 0.0
+
+        queue = self.queues.get(user_id)
+        if queue is not None and len(queue) >= self.max_queue_per_user:
+            self._reject(429, "user_queue_full", estimate)
+        if self.queued >= self.max_queue_total:
+            self._reject(503, "queue_full", estimate)
+        # The SLO covers the LLM call too, not just the time spent queued
+        if estimate + self.avg_latency > self.latency_slo:
+            self._reject(503, "slo", estimate, degradable=True)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.queues.setdefault(user_id, deque()).append(waiter)
+        self.queued += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait({waiter}, timeout=max(0.0, self.latency_slo - self.avg_latency))
+        except asyncio.CancelledError:
+            if waiter.done():
+                self.release()
+            else:
+                self._dequeue(user_id, waiter)
+            raise
+
+        if not waiter.done():
+            # The estimate was optimistic; give up before the SLO is blown
+            self._dequeue(user_id, waiter)
+            self._reject(503, "timeout", self.estimated_wait(), degradable=True)
+
+        wait = time.monotonic() - started
+        self._observe_wait(wait)
+        return wait
+
+    def release(self, duration: Optional[float] = None):
+        """Free a slot acquired by acquire(); duration feeds the wait estimate"""
+        if duration is not None:
+            self.avg_latency = 0.8 * self.avg_latency + 0.2 * duration
+        self.in_flight -= 1
+        self._grant_next()
+
+    def _dequeue(self, user_id: str, waiter):
+        queue = self.queues.get(user_id)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self.queued -= 1
+            if not queue:
+                del self.queues[user_id]
+
+    def _grant_next(self):
+        while self.in_flight < self.max_in_flight and self.queues:
+            user_id, queue = self.queues.popitem(last=False)
+            waiter = queue.popleft()
+            self.queued -= 1
+            if queue:
+                # Back of the line, so other users get the next slots
+                self.queues[user_id] = queue
+            if waiter.done():
+                continue
+            waiter.set_result(None)
+            self.in_flight += 1
+
+    def render_metrics(self) -> str:
+        """Prometheus text exposition of queue depth, in-flight and wait times"""
+        lines = [
+            "# HELP llm_in_flight Chat requests currently holding an LLM slot",
+            "# TYPE llm_in_flight gauge",
+            f"llm_in_flight {self.in_flight}",
+            "# HELP llm_queue_depth Chat requests waiting for an LLM slot",
+            "# TYPE llm_queue_depth gauge",
+            f"llm_queue_depth {self.queued}",
+            "# HELP llm_queue_users Users with at least one queued chat request",
+            "# TYPE llm_queue_users gauge",
+            f"llm_queue_users {len(self.queues)}",
+            "# HELP llm_latency_estimate_seconds Moving average of LLM slot hold time",
+            "# TYPE llm_latency_estimate_seconds gauge",
+            f"llm_latency_estimate_seconds {self.avg_latency:.3f}",
+            "# HELP llm_admitted_total Chat requests admitted to the LLM",
+            "# TYPE llm_admitted_total counter",
+            f"llm_admitted_total {self.admitted_total}",
+            "# HELP llm_rejected_total Chat requests not admitted to the LLM; slo and timeout got a DB-only answer",
+            "# TYPE llm_rejected_total counter",
+        ]
+        for reason, count in self.rejected_total.items():
+            lines.append(f'llm_rejected_total{{reason="{reason}"}} {count}')
+        lines += [
+            "# HELP llm_queue_wait_seconds Time admitted chat requests spent queued",
+            "# TYPE llm_queue_wait_seconds histogram",
+        ]
+        for bound, count in zip(WAIT_BUCKETS, self.wait_bucket_counts):
+            lines.append(f'llm_queue_wait_seconds_bucket{{le="{bound}"}} {count}')
+        lines += [
+            f'llm_queue_wait_seconds_bucket{{le="+Inf"}} {self.wait_count}',
+            f"llm_queue_wait_seconds_sum {self.wait_sum:.3f}",
+            f"llm_queue_wait_seconds_count {self.wait_count}",
+        ]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,152 @@
+"""
+Cold-start and response serialization timings for the API.
+
+Measures both sides of each comparison in one run, using the CSVs in data/:
+  - time from an empty DB to the first successful /api/chat, once by running
+    db.py and load_data.py first (what a fresh container used to do) and once
+    by booting against a prebuilt CATALOG_SNAPSHOT (building the snapshot is
+    a Docker build step and is not counted)
+  - the time to import main.py in a fresh interpreter
+  - the cost of encoding a conversation history response through Pydantic
+    models and FastAPI's default JSON path vs. plain dicts through orjson
+
+Chats use the mock LLM path (GROQ_API_KEY is cleared) so no network time is counted.
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+from main import Conversation, Message
+
+COLD_START_RUNS = 5
+SERIALIZE_RUNS = 50
+
+FIRST_CHAT = """
+import time
+start = time.perf_counter()
+import asyncio
+import main
+response = asyncio.run(main.chat(main.ChatRequest(message="What products do you have?", user_id="bench")))
+assert response.status_code == 200
+print(time.perf_counter() - start)
+"""
+
+def timed_run(args, env):
+    """Wall time of a subprocess in milliseconds"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, *args], env=env, check=True, stdout=subprocess.DEVNULL)
+    return (time.perf_counter() - start) * 1000
+
+def first_chat_ms(env, fresh_db):
+    """Process start to first successful chat, median of COLD_START_RUNS runs
+
+    With fresh_db every run gets its own empty DB_NAME; otherwise all runs use
+    the DB_NAME in env.
+    """
+    samples = []
+    for run in range(COLD_START_RUNS):
+        run_env = env
+        if fresh_db:
+            run_env = dict(env, DB_NAME=os.path.join(env["BENCH_DIR"], f"first-chat-{run}.db"))
+        samples.append(timed_run(["-c", FIRST_CHAT], run_env))
+    return statistics.median(samples)
+
+def time_to_first_chat():
+    """Returns (without snapshot, with snapshot) step timings in milliseconds"""
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, GROQ_API_KEY="", BENCH_DIR=tmp)
+        env.pop("CATALOG_SNAPSHOT", None)
+
+        # Without a snapshot: create the schema and load the CSVs, then chat
+        load_env = dict(env, DB_NAME=os.path.join(tmp, "loaded.db"))
+        without_snapshot = {
+            "db.py": timed_run(["db.py"], load_env),
+            "load_data.py": timed_run(["load_data.py"], load_env),
+        }
+        without_snapshot["first chat"] = first_chat_ms(load_env, fresh_db=False)
+
+        # With a snapshot: boot against an empty DB and the prebuilt catalog
+        snapshot = os.path.join(tmp, "catalog.db")
+        subprocess.run([sys.executable, "db.py", "--snapshot", snapshot], env=load_env,
+                       check=True, stdout=subprocess.DEVNULL)
+        with_snapshot = {"first chat": first_chat_ms(dict(env, CATALOG_SNAPSHOT=snapshot), fresh_db=True)}
+        return without_snapshot, with_snapshot
+
+def cold_start_ms():
+    code = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+    samples = []
+    for _ in range(COLD_START_RUNS):
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        samples.append(float(out.stdout.strip().splitlines()[-1]) * 1000)
+    return statistics.median(samples)
+
+def sample_rows(conversations=20, messages=50):
+    rows = []
+    for conv_id in range(1, conversations + 1):
+        for msg_id in range(messages):
+            rows.append((
+                conv_id, f"session-{conv_id}", "2024-01-01 10:00:00", "2024-01-01 10:30:00",
+                conv_id * messages + msg_id, "user" if msg_id % 2 == 0 else "assistant",
+                "What products do you have in the Jeans category? " * 4, "2024-01-01 10:00:00"
+            ))
+    return rows
+
+def encode_with_models(rows):
+    conversations = {}
+    for conv_id, session_id, created_at, updated_at, msg_id, role, content, timestamp in rows:
+        if conv_id not in conversations:
+            conversations[conv_id] = Conversation(
+                id=str(conv_id), user_id="bench", session_id=session_id, messages=[],
+                created_at=created_at, updated_at=updated_at
+            )
+        conversations[conv_id].messages.append(Message(id=msg_id, role=role, content=content, timestamp=timestamp))
+    # FastAPI re-validates against response_model, then encodes with json.dumps
+    validated = [Conversation.model_validate(c.model_dump()) for c in conversations.values()]
+    return json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+def encode_with_orjson(rows):
+    conversations = []
+    current = None
+    for conv_id, session_id, created_at, updated_at, msg_id, role, content, timestamp in rows:
+        if current is None or current["id"] != str(conv_id):
+            current = {
+                "id": str(conv_id), "user_id": "bench", "session_id": session_id, "messages": [],
+                "created_at": created_at, "updated_at": updated_at
+            }
+            conversations.append(current)
+        current["messages"].append({"id": msg_id, "role": role, "content": content, "timestamp": timestamp})
+    return orjson.dumps(conversations)
+
+def serialize_ms(encode, rows):
+    samples = []
+    for _ in range(SERIALIZE_RUNS):
+        start = time.perf_counter()
+        encode(rows)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+def main():
+    without_snapshot, with_snapshot = time_to_first_chat()
+    print("Empty DB to first /api/chat:")
+    for label, timings in (("without snapshot", without_snapshot), ("with snapshot", with_snapshot)):
+        steps = ", ".join(f"{step} {ms:.0f}ms" for step, ms in timings.items())
+        print(f"  {label + ':':<18} {sum(timings.values()):>8.0f}ms  ({steps})")
+
+    print(f"Cold start (import main, median of {COLD_START_RUNS}): {cold_start_ms():.1f}ms")
+
+    rows = sample_rows()
+    assert orjson.loads(encode_with_models(rows)) == orjson.loads(encode_with_orjson(rows))
+    print(f"Serialize {len(rows)} messages (median of {SERIALIZE_RUNS}):")
+    print(f"  Pydantic + json.dumps: {serialize_ms(encode_with_models, rows):.2f}ms")
+    print(f"  dicts + orjson:        {serialize_ms(encode_with_orjson, rows):.2f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Before/after report for the legacy and compact (DB_STORAGE=compact) catalog layouts.
+
+Builds both databases from the CSVs in data/ using db.py and load_data.py,
+then prints the file size of each and the time taken by a few scans. The
+compact layout is timed both through its compatibility views and directly
+against its base tables.
+"""
+
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+SCAN_QUERIES = {
+    "inventory by category": """
+        SELECT product_category, COUNT(*), SUM(cost)
+        FROM inventory_items
+        GROUP BY product_category
+    """,
+    "unsold inventory": "SELECT COUNT(*) FROM inventory_items WHERE sold_at IS NULL",
+    "orders by status": "SELECT status, COUNT(*) FROM orders GROUP BY status",
+    "delivered orders": "SELECT COUNT(*) FROM orders WHERE status = 'delivered'",
+    "product categories": "SELECT DISTINCT category FROM products",
+}
+
+# The same scans written against the compact base tables, for callers that
+# skip the compatibility views
+COMPACT_NATIVE_QUERIES = {
+    "inventory by category": """
+        SELECT p.category_id, COUNT(*), SUM(i.cost)
+        FROM inventory_items_data i
+        JOIN products_data p ON p.id = i.product_id
+        GROUP BY p.category_id
+    """,
+    "unsold inventory": "SELECT COUNT(*) FROM inventory_items_data WHERE sold_at IS NULL",
+    "orders by status": "SELECT status_id, COUNT(*) FROM orders_data GROUP BY status_id",
+    "delivered orders": """
+        SELECT COUNT(*) FROM orders_data
+        WHERE status_id = (SELECT id FROM statuses WHERE name = 'delivered')
+    """,
+    "product categories": "SELECT name FROM categories",
+}
+
+REPEATS = 5
+
+def build_database(path, storage):
+    env = dict(os.environ, DB_NAME=path, DB_STORAGE=storage)
+    for script in ("db.py", "load_data.py"):
+        subprocess.run([sys.executable, script], env=env, check=True, stdout=subprocess.DEVNULL)
+
+    conn = sqlite3.connect(path)
+    conn.execute("VACUUM")
+    conn.close()
+
+def time_query(path, sql):
+    """Best-of-REPEATS wall time in milliseconds"""
+    conn = sqlite3.connect(path)
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        conn.execute(sql).fetchall()
+        best = min(best, time.perf_counter() - start)
+    conn.close()
+    return best * 1000
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {}
+        for storage in ("legacy", "compact"):
+            paths[storage] = os.path.join(tmp, f"{storage}.db")
+            print(f"Building {storage} database...")
+            build_database(paths[storage], storage)
+
+        print("=" * 50)
+        sizes = {storage: os.path.getsize(path) for storage, path in paths.items()}
+        print(f"{'DB size':<24} {'legacy':>12} {'compact':>12}")
+        print(f"{'':<24} {sizes['legacy'] / 1024:>10.0f}KB {sizes['compact'] / 1024:>10.0f}KB"
+              f"  ({sizes['compact'] / sizes['legacy']:.0%} of legacy)")
+
+        print("=" * 50)
+        print(f"{'Scan (best of %d)' % REPEATS:<24} {'legacy':>12} {'compact view':>14} {'compact table':>14}")
+        for label, sql in SCAN_QUERIES.items():
+            legacy_ms = time_query(paths["legacy"], sql)
+            view_ms = time_query(paths["compact"], sql)
+            native_ms = time_query(paths["compact"], COMPACT_NATIVE_QUERIES[label])
+            print(f"{label:<24} {legacy_ms:>10.2f}ms {view_ms:>12.2f}ms {native_ms:>12.2f}ms")
+
+if __name__ == "__main__":
+    main()
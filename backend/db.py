@@ -1,15 +1,94 @@
 # db.py
+import os
 import sqlite3
+import sys
 
-DB_NAME = "ecommerce.db"
+DB_NAME = os.getenv("DB_NAME", "ecommerce.db")
+
+# DB_STORAGE=compact selects the normalized catalog schema (see
+# create_compact_catalog_tables); anything else keeps the legacy layout.
+COMPACT_STORAGE = os.getenv("DB_STORAGE", "legacy") == "compact"
+
+# Optional prebuilt catalog DB (see build_catalog_snapshot), attached
+# read-only so the app can boot without running load_data.py
+CATALOG_SNAPSHOT = os.getenv("CATALOG_SNAPSHOT")
+
+LOOKUP_TABLES = ("categories", "brands", "statuses")
+
+# Catalog layout recorded in PRAGMA user_version by create_tables
+STORAGE_VERSIONS = {"legacy": 1, "compact": 2}
+
+# STRICT tables need SQLite 3.37+; older libraries get plain tables.
+TABLE_OPTIONS = "STRICT" if sqlite3.sqlite_version_info >= (3, 37, 0) else ""
+LOOKUP_TABLE_OPTIONS = ", ".join(filter(None, ["WITHOUT ROWID", TABLE_OPTIONS]))
 
 def get_connection():
-    return sqlite3.connect(DB_NAME)
+    conn = sqlite3.connect(DB_NAME, uri=True)
+    if CATALOG_SNAPSHOT:
+        # Unqualified table names fall through to the snapshot when DB_NAME
+        # does not define them, so catalog queries need no changes
+        conn.execute("ATTACH DATABASE ? AS catalog", (f"file:{CATALOG_SNAPSHOT}?mode=ro&immutable=1",))
+    return conn
+
+def get_storage_mode(conn):
+    """Catalog layout of DB_NAME itself ("legacy"/"compact"), or None if it has no catalog"""
+    version = conn.execute("PRAGMA main.user_version").fetchone()[0]
+    for mode, mode_version in STORAGE_VERSIONS.items():
+        if version == mode_version:
+            return mode
+
+    # Databases created before the layout was recorded
+    row = conn.execute("SELECT type FROM main.sqlite_master WHERE name = 'products'").fetchone()
+    if row is None:
+        return None
+    return "compact" if row[0] == "view" else "legacy"
 
-def create_tables():
+# catalog_meta value while load_data.py is running
+CATALOG_LOADING = "loading"
+
+def set_catalog_loaded_at(value):
+    """Record catalog load progress in DB_NAME; PromptBuilder keys its cached summary on it"""
     conn = get_connection()
-    cursor = conn.cursor()
+    conn.execute("CREATE TABLE IF NOT EXISTS main.catalog_meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute("INSERT OR REPLACE INTO main.catalog_meta (key, value) VALUES ('loaded_at', ?)", (value,))
+    conn.commit()
+    conn.close()
+
+def get_catalog_loaded_at(conn):
+    """The last value from set_catalog_loaded_at, or None for catalogs loaded without it"""
+    try:
+        row = conn.execute("SELECT value FROM catalog_meta WHERE key = 'loaded_at'").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+def build_catalog_snapshot(path):
+    """Copy the loaded catalog from DB_NAME into a standalone read-only file"""
+    conn = sqlite3.connect(DB_NAME)
+    try:
+        total_products = conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+    except sqlite3.OperationalError:
+        total_products = 0
+    if not total_products:
+        conn.close()
+        raise RuntimeError(f"{DB_NAME} has no products loaded; run load_data.py before building a snapshot")
 
+    if os.path.exists(path):
+        os.remove(path)
+    conn.execute("VACUUM INTO ?", (path,))
+    conn.close()
+
+    snapshot = sqlite3.connect(path)
+    # Chat history stays in the writable DB
+    snapshot.execute("DROP TABLE IF EXISTS messages")
+    snapshot.execute("DROP TABLE IF EXISTS conversations")
+    snapshot.commit()
+    snapshot.execute("VACUUM")
+    snapshot.close()
+    os.chmod(path, 0o444)
+
+def create_legacy_catalog_tables(cursor):
+    """Catalog tables with denormalized product columns and TEXT timestamps"""
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY,
@@ -44,15 +123,6 @@ def create_tables():
         )
     ''')
 
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS distribution_centers (
-            id INTEGER PRIMARY KEY,
-            name TEXT,
-            latitude REAL,
-            longitude REAL
-        )
-    ''')
-
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS inventory_items (
             id INTEGER PRIMARY KEY,
@@ -100,7 +170,161 @@ def create_tables():
         )
     ''')
 
-    # Conversation schema for storing chat histories
+def create_compact_catalog_tables(cursor):
+    """Normalized catalog tables behind views that keep the legacy shape.
+
+    Rows live in *_data tables: timestamps are integer epoch seconds,
+    category/brand/status strings are interned into lookup tables and
+    inventory items only reference their product by product_id. Views
+    named after the legacy tables join everything back together so
+    existing queries keep working unchanged.
+    """
+    for lookup in LOOKUP_TABLES:
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {lookup} (
+                name TEXT PRIMARY KEY,
+                id INTEGER NOT NULL UNIQUE
+            ) {LOOKUP_TABLE_OPTIONS}
+        ''')
+
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS users_data (
+            id INTEGER PRIMARY KEY,
+            first_name TEXT,
+            last_name TEXT,
+            email TEXT,
+            age INTEGER,
+            gender TEXT,
+            state TEXT,
+            street_address TEXT,
+            postal_code TEXT,
+            city TEXT,
+            country TEXT,
+            latitude REAL,
+            longitude REAL,
+            traffic_source TEXT,
+            created_at INTEGER
+        ) {TABLE_OPTIONS}
+    ''')
+
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS products_data (
+            id INTEGER PRIMARY KEY,
+            cost REAL,
+            category_id INTEGER REFERENCES categories (id),
+            name TEXT,
+            brand_id INTEGER REFERENCES brands (id),
+            retail_price REAL,
+            department TEXT,
+            sku TEXT,
+            distribution_center_id INTEGER
+        ) {TABLE_OPTIONS}
+    ''')
+
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS inventory_items_data (
+            id INTEGER PRIMARY KEY,
+            product_id INTEGER REFERENCES products_data (id),
+            created_at INTEGER,
+            sold_at INTEGER,
+            cost REAL
+        ) {TABLE_OPTIONS}
+    ''')
+
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS orders_data (
+            order_id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            status_id INTEGER REFERENCES statuses (id),
+            gender TEXT,
+            created_at INTEGER,
+            returned_at INTEGER,
+            shipped_at INTEGER,
+            delivered_at INTEGER,
+            num_of_item INTEGER
+        ) {TABLE_OPTIONS}
+    ''')
+
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS order_items_data (
+            id INTEGER PRIMARY KEY,
+            order_id INTEGER,
+            user_id INTEGER,
+            product_id INTEGER,
+            inventory_item_id INTEGER,
+            status_id INTEGER REFERENCES statuses (id),
+            created_at INTEGER,
+            shipped_at INTEGER,
+            delivered_at INTEGER,
+            returned_at INTEGER,
+            sale_price REAL
+        ) {TABLE_OPTIONS}
+    ''')
+
+    # Compatibility views with the same names and columns as the legacy tables
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS users AS
+        SELECT id, first_name, last_name, email, age, gender, state,
+               street_address, postal_code, city, country, latitude, longitude,
+               traffic_source, datetime(created_at, 'unixepoch') AS created_at
+        FROM users_data
+    ''')
+
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS products AS
+        SELECT p.id, p.cost, c.name AS category, p.name, b.name AS brand,
+               p.retail_price, p.department, p.sku, p.distribution_center_id
+        FROM products_data p
+        LEFT JOIN categories c ON c.id = p.category_id
+        LEFT JOIN brands b ON b.id = p.brand_id
+    ''')
+
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS inventory_items AS
+        SELECT i.id, i.product_id,
+               datetime(i.created_at, 'unixepoch') AS created_at,
+               datetime(i.sold_at, 'unixepoch') AS sold_at,
+               i.cost,
+               p.category AS product_category,
+               p.name AS product_name,
+               p.brand AS product_brand,
+               p.retail_price AS product_retail_price,
+               p.department AS product_department,
+               p.sku AS product_sku,
+               p.distribution_center_id AS product_distribution_center_id
+        FROM inventory_items_data i
+        LEFT JOIN products p ON p.id = i.product_id
+    ''')
+
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS orders AS
+        SELECT o.order_id, o.user_id, s.name AS status, o.gender,
+               datetime(o.created_at, 'unixepoch') AS created_at,
+               datetime(o.returned_at, 'unixepoch') AS returned_at,
+               datetime(o.shipped_at, 'unixepoch') AS shipped_at,
+               datetime(o.delivered_at, 'unixepoch') AS delivered_at,
+               o.num_of_item
+        FROM orders_data o
+        LEFT JOIN statuses s ON s.id = o.status_id
+    ''')
+
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS order_items AS
+        SELECT oi.id, oi.order_id, oi.user_id, oi.product_id,
+               oi.inventory_item_id, s.name AS status,
+               datetime(oi.created_at, 'unixepoch') AS created_at,
+               datetime(oi.shipped_at, 'unixepoch') AS shipped_at,
+               datetime(oi.delivered_at, 'unixepoch') AS delivered_at,
+               datetime(oi.returned_at, 'unixepoch') AS returned_at,
+               oi.sale_price
+        FROM order_items_data oi
+        LEFT JOIN statuses s ON s.id = oi.status_id
+    ''')
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_inventory_items_data_product ON inventory_items_data(product_id)')
+
+def create_conversation_tables(cursor):
+    """Conversation schema for storing chat histories"""
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS conversations (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -127,9 +351,52 @@ def create_tables():
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages(conversation_id)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp)')
 
+def create_tables(compact=COMPACT_STORAGE):
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    mode = "compact" if compact else "legacy"
+    existing_mode = get_storage_mode(conn)
+    if existing_mode is not None and existing_mode != mode:
+        conn.close()
+        raise RuntimeError(
+            f"{DB_NAME} already holds a {existing_mode} catalog; use DB_STORAGE={existing_mode} "
+            f"or point DB_NAME at a new file to create a {mode} one"
+        )
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS distribution_centers (
+            id INTEGER PRIMARY KEY,
+            name TEXT,
+            latitude REAL,
+            longitude REAL
+        )
+    ''')
+
+    if compact:
+        create_compact_catalog_tables(cursor)
+    else:
+        create_legacy_catalog_tables(cursor)
+
+    create_conversation_tables(cursor)
+    cursor.execute(f"PRAGMA user_version = {STORAGE_VERSIONS[mode]}")
+
     conn.commit()
     conn.close()
 
 if __name__ == "__main__":
-    create_tables()
-    print("All tables created successfully.")
+    if len(sys.argv) == 3 and sys.argv[1] == "--snapshot":
+        try:
+            build_catalog_snapshot(sys.argv[2])
+        except RuntimeError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print(f"Catalog snapshot written to {sys.argv[2]}.")
+        sys.exit(0)
+
+    try:
+        create_tables()
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(f"All tables created successfully ({'compact' if COMPACT_STORAGE else 'legacy'} storage).")
@@ -2,10 +2,42 @@
 import csv
 import os
 import sqlite3
-from db import get_connection
+import sys
+from datetime import datetime, timezone
+from db import get_connection, get_storage_mode, set_catalog_loaded_at, DB_NAME, LOOKUP_TABLES, CATALOG_LOADING
 
 DATA_DIR = "data"
 
+def to_epoch(cursor, value):
+    """Convert a CSV timestamp such as '2019-12-12 07:03:00+00:00' to epoch seconds"""
+    if value is None:
+        return None
+    if value.endswith(" UTC"):
+        value = value[:-4]
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+def interned(lookup_table):
+    """Build a converter that replaces a string with its id in lookup_table"""
+    cache = {}
+
+    def convert(cursor, value):
+        if value is None:
+            return None
+        if value not in cache:
+            cursor.execute(f"SELECT id FROM {lookup_table} WHERE name = ?", (value,))
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {lookup_table}")
+                row = cursor.fetchone()
+                cursor.execute(f"INSERT INTO {lookup_table} (name, id) VALUES (?, ?)", (value, row[0]))
+            cache[value] = row[0]
+        return cache[value]
+
+    return convert
+
 def clear_table(table_name):
     """Clear existing data from a table"""
     conn = get_connection()
@@ -19,8 +51,15 @@ def clear_table(table_name):
     finally:
         conn.close()
 
-def load_csv(file_name, table_name, columns, clear_existing=True):
-    """Load CSV data into database table"""
+def load_csv(file_name, table_name, columns, clear_existing=True,
+             target_columns=None, converters=None):
+    """Load CSV data into database table
+
+    target_columns renames CSV columns on insert (defaults to columns) and
+    converters maps a CSV column to a callable(cursor, value) applied first.
+    """
+    target_columns = target_columns or columns
+    converters = converters or {}
     conn = get_connection()
     cursor = conn.cursor()
     path = os.path.join(DATA_DIR, file_name)
@@ -47,11 +86,13 @@ def load_csv(file_name, table_name, columns, clear_existing=True):
                         # Convert empty strings to None
                         if value == '':
                             value = None
+                        if col in converters:
+                            value = converters[col](cursor, value)
                         values.append(value)
                     
                     placeholders = ', '.join('?' * len(columns))
                     cursor.execute(f'''
-                        INSERT INTO {table_name} ({', '.join(columns)})
+                        INSERT INTO {table_name} ({', '.join(target_columns)})
                         VALUES ({placeholders})
                     ''', values)
                     count += 1
@@ -61,7 +102,7 @@ def load_csv(file_name, table_name, columns, clear_existing=True):
                         conn.commit()
                         print(f"  Processed {count} rows...")
                         
-                except sqlite3.Error as e:
+                except (sqlite3.Error, ValueError) as e:
                     print(f"Error inserting row {count + 1}: {e}")
                     print(f"Row data: {row}")
                     continue
@@ -74,15 +115,8 @@ def load_csv(file_name, table_name, columns, clear_existing=True):
         print(f" Error loading {file_name}: {e}")
         conn.close()
 
-def main():
-    print(" Starting data loading process...")
-    print("=" * 50)
-    
-    # Load data in order of dependencies
-    load_csv("distribution_centers.csv", "distribution_centers", [
-        "id", "name", "latitude", "longitude"
-    ])
-    
+def load_legacy():
+    """Load the catalog CSVs into the denormalized tables from db.create_legacy_catalog_tables"""
     load_csv("users.csv", "users", [
         "id", "first_name", "last_name", "email", "age", "gender", "state", "street_address",
         "postal_code", "city", "country", "latitude", "longitude", "traffic_source", "created_at"
@@ -108,6 +142,75 @@ def main():
         "id", "order_id", "user_id", "product_id", "inventory_item_id", "status",
         "created_at", "shipped_at", "delivered_at", "returned_at", "sale_price"
     ])
+
+def load_compact():
+    """Load the catalog CSVs into the normalized tables from db.create_compact_catalog_tables"""
+    for lookup_table in LOOKUP_TABLES:
+        clear_table(lookup_table)
+
+    load_csv("users.csv", "users_data", [
+        "id", "first_name", "last_name", "email", "age", "gender", "state", "street_address",
+        "postal_code", "city", "country", "latitude", "longitude", "traffic_source", "created_at"
+    ], converters={"created_at": to_epoch})
+
+    load_csv("products.csv", "products_data", [
+        "id", "cost", "category", "name", "brand", "retail_price",
+        "department", "sku", "distribution_center_id"
+    ], target_columns=[
+        "id", "cost", "category_id", "name", "brand_id", "retail_price",
+        "department", "sku", "distribution_center_id"
+    ], converters={"category": interned("categories"), "brand": interned("brands")})
+
+    # Product columns are not copied; the inventory_items view joins them back in
+    load_csv("inventory_items.csv", "inventory_items_data", [
+        "id", "product_id", "created_at", "sold_at", "cost"
+    ], converters={"created_at": to_epoch, "sold_at": to_epoch})
+
+    load_csv("orders.csv", "orders_data", [
+        "order_id", "user_id", "status", "gender", "created_at", "returned_at",
+        "shipped_at", "delivered_at", "num_of_item"
+    ], target_columns=[
+        "order_id", "user_id", "status_id", "gender", "created_at", "returned_at",
+        "shipped_at", "delivered_at", "num_of_item"
+    ], converters={
+        "status": interned("statuses"), "created_at": to_epoch, "returned_at": to_epoch,
+        "shipped_at": to_epoch, "delivered_at": to_epoch
+    })
+
+    load_csv("order_items.csv", "order_items_data", [
+        "id", "order_id", "user_id", "product_id", "inventory_item_id", "status",
+        "created_at", "shipped_at", "delivered_at", "returned_at", "sale_price"
+    ], target_columns=[
+        "id", "order_id", "user_id", "product_id", "inventory_item_id", "status_id",
+        "created_at", "shipped_at", "delivered_at", "returned_at", "sale_price"
+    ], converters={
+        "status": interned("statuses"), "created_at": to_epoch, "shipped_at": to_epoch,
+        "delivered_at": to_epoch, "returned_at": to_epoch
+    })
+
+def main():
+    # Load into whatever layout db.py created, not whatever DB_STORAGE says now
+    conn = get_connection()
+    storage_mode = get_storage_mode(conn)
+    conn.close()
+    if storage_mode is None:
+        print(f"Error: {DB_NAME} has no catalog tables, run db.py first")
+        sys.exit(1)
+
+    print(f" Starting data loading process ({storage_mode} storage)...")
+    print("=" * 50)
+    set_catalog_loaded_at(CATALOG_LOADING)
+    
+    # Load data in order of dependencies
+    load_csv("distribution_centers.csv", "distribution_centers", [
+        "id", "name", "latitude", "longitude"
+    ])
+
+    if storage_mode == "compact":
+        load_compact()
+    else:
+        load_legacy()
+    set_catalog_loaded_at(datetime.now(timezone.utc).isoformat())
     
     print("=" * 50)
     print("🏁 Data loading completed!")
@@ -1,23 +1,54 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional, List
-from dotenv import load_dotenv
-import sqlite3
+from functools import lru_cache
+from contextlib import asynccontextmanager
 import uuid
 import os
-import requests
-import json
 from datetime import datetime
 import logging
+import asyncio
+import time
 
-# Configure logging
+from dotenv import load_dotenv
+
+# Load .env before anything reads settings from the environment, including
+# db.py at import time and the admission limits below
 load_dotenv()
 
+from admission import AdmissionController, AdmissionRejected
+from db import get_connection, create_conversation_tables
+from prompt_builder import PromptBuilder, format_table
+
+# Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="E-commerce AI Agent API", version="1.0.0")
+def _log_warm_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Could not warm the prompt prefix: {task.exception()}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Summarize the catalog in the background so the first chat does not pay for it
+    warm = asyncio.create_task(run_in_threadpool(get_llm().prompt_builder.refresh))
+    warm.add_done_callback(_log_warm_failure)
+    yield
+    if not warm.done():
+        warm.cancel()
+
+# Handlers return plain dicts built from SQLite rows; orjson encodes them
+# without a Pydantic validation pass. The response models below still
+# document the shapes in the OpenAPI schema.
+app = FastAPI(
+    title="E-commerce AI Agent API",
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
+)
 
 # CORS middleware
 app.add_middleware(
@@ -54,8 +85,17 @@ class Conversation(BaseModel):
     updated_at: str
 
 # Database functions
+_schema_ready = False
+
 def get_db_connection():
-    return sqlite3.connect("ecommerce.db")
+    """Open a connection, creating the conversation tables on first use"""
+    global _schema_ready
+    conn = get_connection()
+    if not _schema_ready:
+        create_conversation_tables(conn.cursor())
+        conn.commit()
+        _schema_ready = True
+    return conn
 
 def get_or_create_conversation(user_id: str, conversation_id: Optional[str] = None):
     conn = get_db_connection()
@@ -111,7 +151,7 @@ def get_conversation_history(conversation_id: int):
         SELECT id, role, content, timestamp 
         FROM messages 
         WHERE conversation_id = ? 
-        ORDER BY timestamp ASC
+        ORDER BY timestamp ASC, id ASC
     """, (conversation_id,))
     
     messages = []
@@ -127,10 +167,13 @@ def get_conversation_history(conversation_id: int):
     return messages
 
 # LLM Integration with Groq
+DB_KEYWORDS = ["product", "order", "user", "revenue", "sales"]
+
 class GroqLLM:
     def __init__(self):
         self.api_key = os.getenv("GROQ_API_KEY")
         self.base_url = "https://api.groq.com/openai/v1/chat/completions"
+        self.prompt_builder = PromptBuilder(get_db_connection)
         
         if not self.api_key:
             logger.warning("GROQ_API_KEY not found. Using mock responses.")
@@ -139,23 +182,25 @@ class GroqLLM:
         """Query the e-commerce database based on the user's question"""
         conn = get_db_connection()
         cursor = conn.cursor()
-        
+        try:
+            return self._query_database(cursor, query)
+        finally:
+            conn.close()
+
+    def _query_database(self, cursor, query: str):
         # Simple keyword-based query routing
         query_lower = query.lower()
         
         if "product" in query_lower or "item" in query_lower:
             if "category" in query_lower:
                 cursor.execute("SELECT DISTINCT category FROM products LIMIT 10")
-                results = cursor.fetchall()
-                return f"Available product categories: {[row[0] for row in results]}"
+                return f"Available product categories:\n{format_table(['category'], cursor.fetchall())}"
             elif "brand" in query_lower:
                 cursor.execute("SELECT DISTINCT brand FROM products LIMIT 10")
-                results = cursor.fetchall()
-                return f"Available brands: {[row[0] for row in results]}"
+                return f"Available brands:\n{format_table(['brand'], cursor.fetchall())}"
             else:
                 cursor.execute("SELECT name, brand, category, retail_price FROM products LIMIT 5")
-                results = cursor.fetchall()
-                return f"Sample products: {[{'name': row[0], 'brand': row[1], 'category': row[2], 'price': row[3]} for row in results]}"
+                return f"Sample products:\n{format_table(['name', 'brand', 'category', 'price'], cursor.fetchall())}"
         
         elif "order" in query_lower or "purchase" in query_lower:
             cursor.execute("SELECT COUNT(*) FROM orders")
@@ -176,8 +221,6 @@ class GroqLLM:
         
         else:
             return "I can help you with information about products, orders, customers, and sales. What would you like to know?"
-        
-        conn.close()
     
     def generate_response(self, user_message: str, conversation_history: List[dict]):
         """Generate AI response using Groq API"""
@@ -186,34 +229,15 @@ class GroqLLM:
             db_result = self.query_database(user_message)
             return f"I'm here to help with your e-commerce questions! {db_result}"
         
-        # Build conversation context
-        messages = [
-            {
-                "role": "system",
-                "content": """You are an AI assistant for an e-commerce platform. You help users with:
-                1. Product information and recommendations
-                2. Order status and history
-                3. Customer support
-                4. Sales and analytics data
-                
-                Always be helpful, friendly, and provide accurate information based on the available data."""
-            }
-        ]
+        # Give the model the relevant DB rows up front instead of appending them to its reply
+        db_result = None
+        if any(keyword in user_message.lower() for keyword in DB_KEYWORDS):
+            db_result = self.query_database(user_message)
         
-        # Add conversation history
-        for msg in conversation_history:
-            messages.append({
-                "role": msg["role"],
-                "content": msg["content"]
-            })
-        
-        # Add current user message
-        messages.append({
-            "role": "user",
-            "content": user_message
-        })
+        messages, token_counts = self.prompt_builder.build(user_message, conversation_history, db_result)
         
         try:
+            import requests
             response = requests.post(
                 self.base_url,
                 headers={
@@ -231,30 +255,65 @@ class GroqLLM:
             
             if response.status_code == 200:
                 result = response.json()
-                ai_response = result["choices"][0]["message"]["content"]
-                
-                # Enhance response with database query if relevant
-                if any(keyword in user_message.lower() for keyword in ["product", "order", "user", "revenue", "sales"]):
-                    db_result = self.query_database(user_message)
-                    ai_response += f"\n\nBased on our database: {db_result}"
-                
-                return ai_response
+                self.log_token_usage(token_counts, result.get("usage"))
+                return result["choices"][0]["message"]["content"]
             else:
                 logger.error(f"Groq API error: {response.status_code} - {response.text}")
                 return "I'm having trouble connecting to my AI service right now. Let me help you with basic information from our database."
                 
         except Exception as e:
             logger.error(f"Error calling Groq API: {e}")
-            db_result = self.query_database(user_message)
+            db_result = db_result or self.query_database(user_message)
             return f"I'm experiencing some technical difficulties, but I can still help you with basic information: {db_result}"
 
-# Initialize LLM
-llm = GroqLLM()
+    def db_only_response(self, user_message: str):
+        """Answer from the database alone, for when the LLM is overloaded"""
+        db_result = self.query_database(user_message)
+        return f"I'm handling a lot of requests right now, so here is what I can tell you from our database: {db_result}"
+
+    def log_token_usage(self, token_counts: dict, usage: Optional[dict]):
+        """Log estimated prompt tokens per turn next to what the provider billed"""
+        usage = usage or {}
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        logger.info(
+            f"Prompt tokens: estimated={token_counts['total']} (prefix={token_counts['prefix']}, "
+            f"history={token_counts['history']}, turn={token_counts['turn']}, "
+            f"dropped_messages={token_counts['dropped_messages']}), "
+            f"provider prompt={usage.get('prompt_tokens')} cached={cached} "
+            f"completion={usage.get('completion_tokens')}"
+        )
+
+# Created on first use so importing main does not pay for requests
+@lru_cache(maxsize=None)
+def get_llm():
+    return GroqLLM()
+
+# Admission control in front of the LLM
+admission = AdmissionController(
+    max_in_flight=int(os.getenv("LLM_MAX_IN_FLIGHT", "4")),
+    max_queue_per_user=int(os.getenv("LLM_MAX_QUEUE_PER_USER", "2")),
+    max_queue_total=int(os.getenv("LLM_MAX_QUEUE", "32")),
+    latency_slo=float(os.getenv("LLM_LATENCY_SLO_SECONDS", "15")),
+)
 
 # API Endpoints
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     """Main chat endpoint"""
+    # Admit before touching the DB so rejected requests leave no empty conversation
+    degraded = False
+    try:
+        await admission.acquire(request.user_id)
+    except AdmissionRejected as e:
+        if not e.degradable:
+            raise HTTPException(
+                status_code=e.status_code,
+                detail="Too many requests, please try again shortly",
+                headers={"Retry-After": str(e.retry_after)}
+            )
+        degraded = True
+
+    started = time.monotonic()
     try:
         # Get or create conversation
         conversation_id, session_id = get_or_create_conversation(
@@ -265,8 +324,11 @@ async def chat(request: ChatRequest):
         # Get conversation history
         history = get_conversation_history(conversation_id)
         
-        # Generate AI response
-        ai_response = llm.generate_response(request.message, history)
+        # Generate AI response; the LLM call blocks, so keep it off the event loop
+        if degraded:
+            ai_response = await run_in_threadpool(get_llm().db_only_response, request.message)
+        else:
+            ai_response = await run_in_threadpool(get_llm().generate_response, request.message, history)
         
         # Save user message
         user_message_id = save_message(conversation_id, "user", request.message)
@@ -274,16 +336,20 @@ async def chat(request: ChatRequest):
         # Save AI response
         ai_message_id = save_message(conversation_id, "assistant", ai_response)
         
-        return ChatResponse(
-            response=ai_response,
-            conversation_id=str(conversation_id),
-            message_id=ai_message_id
-        )
+        return ORJSONResponse({
+            "response": ai_response,
+            "conversation_id": str(conversation_id),
+            "message_id": ai_message_id
+        })
         
     except Exception as e:
         logger.error(f"Error in chat endpoint: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+    finally:
+        if not degraded:
+            admission.release(time.monotonic() - started)
+
 @app.get("/api/conversations/{user_id}", response_model=List[Conversation])
 async def get_user_conversations(user_id: str):
     """Get all conversations for a user"""
@@ -291,45 +357,39 @@ async def get_user_conversations(user_id: str):
         conn = get_db_connection()
         cursor = conn.cursor()
         
+        # One query for all conversations and their messages, newest conversation first
         cursor.execute("""
-            SELECT c.id, c.session_id, c.created_at, c.updated_at
+            SELECT c.id, c.session_id, c.created_at, c.updated_at,
+                   m.id, m.role, m.content, m.timestamp
             FROM conversations c
+            LEFT JOIN messages m ON m.conversation_id = c.id
             WHERE c.user_id = ?
-            ORDER BY c.updated_at DESC
+            ORDER BY c.updated_at DESC, c.id, m.timestamp ASC, m.id ASC
         """, (user_id,))
         
         conversations = []
-        for row in cursor.fetchall():
-            conv_id, session_id, created_at, updated_at = row
-            
-            # Get messages for this conversation
-            cursor.execute("""
-                SELECT id, role, content, timestamp
-                FROM messages
-                WHERE conversation_id = ?
-                ORDER BY timestamp ASC
-            """, (conv_id,))
-            
-            messages = []
-            for msg_row in cursor.fetchall():
-                messages.append(Message(
-                    id=msg_row[0],
-                    role=msg_row[1],
-                    content=msg_row[2],
-                    timestamp=msg_row[3]
-                ))
-            
-            conversations.append(Conversation(
-                id=str(conv_id),
-                user_id=user_id,
-                session_id=session_id,
-                messages=messages,
-                created_at=created_at,
-                updated_at=updated_at
-            ))
+        current = None
+        for conv_id, session_id, created_at, updated_at, msg_id, role, content, timestamp in cursor.fetchall():
+            if current is None or current["id"] != str(conv_id):
+                current = {
+                    "id": str(conv_id),
+                    "user_id": user_id,
+                    "session_id": session_id,
+                    "messages": [],
+                    "created_at": created_at,
+                    "updated_at": updated_at
+                }
+                conversations.append(current)
+            if msg_id is not None:
+                current["messages"].append({
+                    "id": msg_id,
+                    "role": role,
+                    "content": content,
+                    "timestamp": timestamp
+                })
         
         conn.close()
-        return conversations
+        return ORJSONResponse(conversations)
         
     except Exception as e:
         logger.error(f"Error getting conversations: {e}")
@@ -340,6 +400,11 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """LLM admission metrics in Prometheus text format"""
+    return admission.render_metrics()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
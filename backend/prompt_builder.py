@@ -0,0 +1,171 @@
+# prompt_builder.py
+import logging
+import math
+import time
+from typing import Callable, List, Optional
+
+from db import CATALOG_LOADING, get_catalog_loaded_at
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = """You are an AI assistant for an e-commerce platform. You help users with:
+1. Product information and recommendations
+2. Order status and history
+3. Customer support
+4. Sales and analytics data
+
+Always be helpful, friendly, and provide accurate information based on the available data.
+Tables are given as a header line followed by one row per line, with | between columns."""
+
+# Rough BPE average for English text; close enough to budget a prompt without
+# shipping a tokenizer
+CHARS_PER_TOKEN = 4
+# Per-message framing (role markers, separators) added by chat templates
+TOKENS_PER_MESSAGE = 4
+
+# How long a summary is reused for catalogs that carry no load marker
+# (loaded before load_data.py recorded one)
+CATALOG_CONTEXT_TTL = 300
+
+# llama3-8b-8192 context minus the 500 completion tokens we request, with headroom
+MAX_PROMPT_TOKENS = 7000
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def count_message_tokens(messages: List[dict]) -> int:
+    return sum(estimate_tokens(m["content"]) + TOKENS_PER_MESSAGE for m in messages)
+
+def format_table(columns: List[str], rows) -> str:
+    """Serialize DB rows as a header line plus one |-separated line per row"""
+    lines = ["|".join(columns)]
+    for row in rows:
+        lines.append("|".join("" if value is None else str(value) for value in row))
+    return "\n".join(lines)
+
+class PromptBuilder:
+    """Assembles chat messages behind a stable system prefix.
+
+    The system message (instructions plus a catalog summary) is built once
+    per catalog load and reused verbatim on every turn, followed by the
+    conversation history and then anything specific to the current turn. Keeping the front of the
+    prompt byte-identical lets providers with prefix caching reuse it.
+    """
+
+    def __init__(self, get_connection: Callable, max_prompt_tokens: int = MAX_PROMPT_TOKENS):
+        self.get_connection = get_connection
+        self.max_prompt_tokens = max_prompt_tokens
+        self._system_message: Optional[dict] = None
+        # Load marker and time the cached summary was built from
+        self._loaded_at: Optional[str] = None
+        self._cached_at = 0.0
+
+    def catalog_context(self) -> Optional[str]:
+        """Summarize the catalog so the model has business context up front
+
+        Returns None while products, orders or order items are still empty,
+        so a partially loaded catalog is never summarized.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT COUNT(*) FROM products")
+            total_products = cursor.fetchone()[0]
+            cursor.execute("SELECT COUNT(*) FROM users")
+            total_users = cursor.fetchone()[0]
+            cursor.execute("SELECT COUNT(*), SUM(status = 'delivered') FROM orders")
+            total_orders, delivered_orders = cursor.fetchone()
+            cursor.execute("SELECT SUM(sale_price) FROM order_items")
+            total_revenue = cursor.fetchone()[0]
+            cursor.execute("SELECT DISTINCT category FROM products WHERE category IS NOT NULL ORDER BY category")
+            categories = [row[0] for row in cursor.fetchall()]
+            cursor.execute("SELECT DISTINCT department FROM products WHERE department IS NOT NULL ORDER BY department")
+            departments = [row[0] for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+        if not (total_products and total_orders and total_revenue):
+            return None
+        return "\n".join([
+            "Catalog summary:",
+            format_table(
+                ["products", "customers", "orders", "delivered_orders", "revenue"],
+                [[total_products, total_users, total_orders, delivered_orders or 0,
+                  f"{total_revenue:.2f}" if total_revenue else 0]]
+            ),
+            f"Departments: {', '.join(departments)}",
+            f"Categories: {', '.join(categories)}",
+        ])
+
+    def system_message(self) -> dict:
+        """The cached stable prefix
+
+        The cache is keyed on the load marker written by load_data.py, so a
+        reload is picked up on the next turn; catalogs without a marker fall
+        back to CATALOG_CONTEXT_TTL. Only a prefix with a catalog summary is
+        cached. While data is loading or the catalog cannot be summarized
+        (tables missing or still empty) the bare instructions are used.
+        """
+        loaded_at = self._read_loaded_at()
+        if self._system_message is not None and loaded_at == self._loaded_at:
+            if loaded_at is not None or time.monotonic() - self._cached_at < CATALOG_CONTEXT_TTL:
+                return self._system_message
+        return self._rebuild(loaded_at)
+
+    def refresh(self) -> dict:
+        """Rebuild the cached prefix from the current catalog"""
+        return self._rebuild(self._read_loaded_at())
+
+    def _read_loaded_at(self) -> Optional[str]:
+        conn = self.get_connection()
+        try:
+            return get_catalog_loaded_at(conn)
+        finally:
+            conn.close()
+
+    def _rebuild(self, loaded_at: Optional[str]) -> dict:
+        self._system_message = None
+        if loaded_at == CATALOG_LOADING:
+            return {"role": "system", "content": SYSTEM_PROMPT}
+        try:
+            context = self.catalog_context()
+        except Exception as e:
+            logger.warning(f"Could not build catalog context: {e}")
+            context = None
+        if context is None:
+            return {"role": "system", "content": SYSTEM_PROMPT}
+
+        self._system_message = {"role": "system", "content": f"{SYSTEM_PROMPT}\n\n{context}"}
+        self._loaded_at = loaded_at
+        self._cached_at = time.monotonic()
+        return self._system_message
+
+    def build(self, user_message: str, conversation_history: List[dict], db_result: Optional[str] = None):
+        """Return (messages, token_counts) for one turn
+
+        The oldest history messages are dropped when the estimated prompt
+        size would exceed max_prompt_tokens.
+        """
+        prefix = [self.system_message()]
+        turn = []
+        if db_result:
+            turn.append({"role": "system", "content": f"Database results for this question:\n{db_result}"})
+        turn.append({"role": "user", "content": user_message})
+
+        history = [{"role": msg["role"], "content": msg["content"]} for msg in conversation_history]
+        fixed_tokens = count_message_tokens(prefix) + count_message_tokens(turn)
+        history_tokens = count_message_tokens(history)
+        dropped = 0
+        while history and fixed_tokens + history_tokens > self.max_prompt_tokens:
+            oldest = history.pop(0)
+            history_tokens -= estimate_tokens(oldest["content"]) + TOKENS_PER_MESSAGE
+            dropped += 1
+
+        token_counts = {
+            "prefix": count_message_tokens(prefix),
+            "history": history_tokens,
+            "turn": count_message_tokens(turn),
+            "total": fixed_tokens + history_tokens,
+            "dropped_messages": dropped,
+        }
+        return prefix + history + turn, token_counts
@@ -0,0 +1,149 @@
+"""
+Tests for the LLM admission controller (run with: python -m pytest test_admission.py)
+"""
+
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+async def settle():
+    """Let queued tasks run up to their next await"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+async def enqueue(controller, user_id, granted):
+    await controller.acquire(user_id)
+    granted.append(user_id)
+
+def test_round_robin_across_users():
+    async def run():
+        controller = AdmissionController(max_in_flight=1, max_queue_per_user=2, latency_slo=60)
+        await controller.acquire("hog")
+
+        granted = []
+        tasks = [asyncio.create_task(enqueue(controller, user_id, granted))
+                 for user_id in ("hog", "hog", "alice", "bob")]
+        await settle()
+        assert controller.queued == 4
+
+        for _ in tasks:
+            controller.release(0.1)
+            await settle()
+
+        await asyncio.gather(*tasks)
+        assert granted == ["hog", "alice", "bob", "hog"]
+        assert controller.queued == 0
+        assert not controller.queues
+        assert controller.in_flight == 1
+
+    asyncio.run(run())
+
+def test_cancel_while_queued_frees_the_queue_entry():
+    async def run():
+        controller = AdmissionController(max_in_flight=1, latency_slo=60)
+        await controller.acquire("a")
+
+        granted = []
+        cancelled = asyncio.create_task(enqueue(controller, "b", granted))
+        waiting = asyncio.create_task(enqueue(controller, "c", granted))
+        await settle()
+
+        cancelled.cancel()
+        await settle()
+        assert controller.queued == 1
+        assert "b" not in controller.queues
+
+        controller.release(0.1)
+        await waiting
+        assert granted == ["c"]
+        assert controller.in_flight == 1
+
+    asyncio.run(run())
+
+def test_cancel_after_grant_releases_the_slot():
+    async def run():
+        controller = AdmissionController(max_in_flight=1, latency_slo=60)
+        await controller.acquire("a")
+
+        task = asyncio.create_task(controller.acquire("b"))
+        await settle()
+
+        # Slot handed to "b", which is cancelled before it gets to run
+        controller.release(0.1)
+        task.cancel()
+        await settle()
+
+        assert task.cancelled()
+        assert controller.in_flight == 0
+        assert controller.queued == 0
+
+    asyncio.run(run())
+
+def test_queued_request_times_out_as_degradable():
+    async def run():
+        controller = AdmissionController(max_in_flight=1, latency_slo=0.2, initial_latency=0.05)
+        await controller.acquire("a")
+
+        with pytest.raises(AdmissionRejected) as excinfo:
+            await controller.acquire("b")
+
+        assert excinfo.value.reason == "timeout"
+        assert excinfo.value.status_code == 503
+        assert excinfo.value.degradable
+        assert controller.queued == 0
+        assert not controller.queues
+        assert controller.in_flight == 1
+
+    asyncio.run(run())
+
+def test_slo_rejects_up_front_as_degradable():
+    async def run():
+        controller = AdmissionController(max_in_flight=1, latency_slo=1, initial_latency=2)
+        await controller.acquire("a")
+
+        with pytest.raises(AdmissionRejected) as excinfo:
+            await controller.acquire("b")
+
+        assert excinfo.value.reason == "slo"
+        assert excinfo.value.degradable
+        assert excinfo.value.retry_after >= 1
+        assert controller.queued == 0
+
+    asyncio.run(run())
+
+def test_full_queues_are_rejected():
+    async def run():
+        controller = AdmissionController(max_in_flight=1, max_queue_per_user=1, max_queue_total=2,
+                                         latency_slo=60)
+        await controller.acquire("a")
+        tasks = [asyncio.create_task(controller.acquire(user_id)) for user_id in ("b", "c")]
+        await settle()
+
+        with pytest.raises(AdmissionRejected) as excinfo:
+            await controller.acquire("b")
+        assert excinfo.value.status_code == 429
+        assert not excinfo.value.degradable
+
+        with pytest.raises(AdmissionRejected) as excinfo:
+            await controller.acquire("d")
+        assert excinfo.value.status_code == 503
+        assert excinfo.value.reason == "queue_full"
+
+        for task in tasks:
+            task.cancel()
+        await settle()
+        assert controller.queued == 0
+
+    asyncio.run(run())
+
+@pytest.mark.parametrize("kwargs", [
+    {"max_in_flight": 0},
+    {"max_queue_per_user": 0},
+    {"max_queue_total": -1},
+    {"latency_slo": 0},
+])
+def test_invalid_limits_are_rejected(kwargs):
+    with pytest.raises(ValueError):
+        AdmissionController(**kwargs)